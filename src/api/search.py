@@ -1,47 +1,84 @@
 import asyncio
-import json
-from typing import List, AsyncGenerator
-from src.config import Config
-from src.service.MnemsoyneService import MnemsoyneService
-from src.service.LLMService import LLMService, LLMMode
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncGenerator, List
+
+import orjson
 
-config = Config()
-mnemosyne_service = MnemsoyneService(config)
-llm_service = LLMService(config)
+from src.config import get_config
+from src.service.MnemsoyneService import MnemsoyneService
+from src.service.LLMService import LLMMode
 
 # Set the LLMMode manually here
 LLM_MODE = LLMMode.SYNC  # or LLMMode.ASYNC
 
+# A '-'-separated part made only of letters and digits, containing at least one of each. ASCII-only:
+# for other scripts \d and \w disagree with str.isdigit/isalnum (e.g. '½', '²'), so those slugs take the loop
+_SLUG_ID_RE = re.compile(r'(?:^|-)(?=[^\W_]*\d)(?=[^\W_]*[^\W\d_])[^\W_]+(?=-|\Z)', re.ASCII)
+
+# Static SSE framing, encoded once
+_DATA_PREFIX = b'data: '
+_SSE_TAIL = b'\n\n'
+_ERROR_FRAME = b'data: {"error": "An error occurred while processing your request"}\n\n'
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+@lru_cache(maxsize=1)
+def get_mnemosyne_service() -> MnemsoyneService:
+    """Return the shared MnemsoyneService, building it on first use."""
+    return MnemsoyneService(get_config())
+
+def configure_default_executor() -> None:
+    """Size the running loop's default executor, which backs asyncio.to_thread."""
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=get_config().SERVER.THREAD_POOL_SIZE)
+    )
+
+async def warm_up_service() -> None:
+    """Build the shared service off the event loop so the first search doesn't stall it."""
+    # Loading the embedding model and connecting to Mongo both block
+    await asyncio.to_thread(get_mnemosyne_service)
+
+@lru_cache(maxsize=2048)
 def decode_query(query: str) -> str:
     """Decode the query string."""
-    query_parts = query.split('-')
+    # The slug ends at the first '-'-separated part mixing letters and digits (the article id)
+    if query.isascii():
+        match = _SLUG_ID_RE.search(query)
+        if match is not None:
+            query = query[:match.start()]
+        return query.replace('-', ' ')
+
     decoded_parts: List[str] = []
-    for part in query_parts:
+    for part in query.split('-'):
         if part.isalnum() and not part.isalpha() and not part.isdigit():
             break
         decoded_parts.append(part)
     return ' '.join(decoded_parts)
 
-async def stream_response(query: str) -> AsyncGenerator[str, None]:
+async def stream_response(query: str, llm_mode: LLMMode = LLM_MODE) -> AsyncGenerator[bytes, None]:
     """Generate streaming response for the given query."""
     try:
-        retrieved_info = mnemosyne_service.retrieve_knowlede(query, LLM_MODE)
+        retrieved_info = get_mnemosyne_service().retrieve_knowlede(query, llm_mode)
         async for chunk in retrieved_info:
-            if isinstance(chunk, str):
-                if chunk.startswith("{"):
-                    yield f'data: {chunk}\n\n'
-                else:
-                    lines = chunk.split('\n')
-                    for line in lines:
-                        if line.strip():
-                            yield f'data: {line}\n\n'
-                            await asyncio.sleep(0.12)
-            elif isinstance(chunk, dict):
-                yield f'data: {json.dumps(chunk)}\n\n'
+            # Answer text arrives as str, the closing metadata object as dict
+            if isinstance(chunk, dict):
+                yield _DATA_PREFIX + orjson.dumps(chunk) + _SSE_TAIL
             else:
-                print(f"Unexpected chunk type: {type(chunk)}")
+                # Frame every line of the chunk into one buffer so it goes out as a single write
+                frames = bytearray()
+                for line in chunk.split('\n'):
+                    if line.strip():
+                        frames += _DATA_PREFIX
+                        frames += line.encode()
+                        frames += _SSE_TAIL
+                if frames:
+                    yield bytes(frames)
 
-        yield ''
+        yield b''
     except Exception as e:
         print(f"Error processing query: {str(e)}")
-        yield f'data: {{"error": "An error occurred while processing your request"}}\n\n'
\ No newline at end of file
+        yield _ERROR_FRAME
\ No newline at end of file
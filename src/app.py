@@ -1,11 +1,20 @@
+import asyncio
+
+import uvloop
 from quart import Quart, render_template, Response
 from quart_cors import cors
-from src.api.search import decode_query, stream_response
+from src.api.search import SSE_HEADERS, configure_default_executor, decode_query, stream_response, \
+    warm_up_service
 
 app = Quart(__name__, template_folder='./templates', static_folder=''
                                                                    './static')
 app = cors(app)
 
+@app.before_serving
+async def startup():
+    configure_default_executor()
+    await warm_up_service()
+
 @app.route('/')
 async def home():
     return await render_template('index.html')
@@ -17,11 +26,10 @@ async def search(query: str) -> Response:
     return Response(
         stream_response(final_query),
         mimetype='text/event-stream',
-        headers={
-            'Cache-Control': 'no-cache',
-            'X-Accel-Buffering': 'no'
-        }
+        headers=SSE_HEADERS
     )
 
 if __name__ == '__main__':
+    # Quart's runner creates its loop through the policy, so this swaps in uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
     app.run()
\ No newline at end of file
@@ -1,18 +1,98 @@
-class Config:
-    class MONGO:
-        USERNAME: str = ""
-        PWRD: str = ""
-        DB_NAME: str = "Mnemosyne"
-        COLLECTION: str = "medium"
-    
-    class FIRECRAWL:
-        API_KEY: str = "API_KEY"
-
-    class OPENAI:
-        API_KEY: str = ""
-
-    class LLM:
-        MODEL_NAME: str = "llama3.2" #mistral,llama3.2
-        TOKEN_LIMIT: int = 125000
-        TEMPERATURE: float = 0.1
-        OPENAI_TIMEOUT: int = 20
\ No newline at end of file
+import os
+from functools import lru_cache
+
+from pydantic import BaseModel, ConfigDict
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class MongoConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    USERNAME: str = ""
+    PWRD: str = ""
+    DB_NAME: str = "Mnemosyne"
+    COLLECTION: str = "medium"
+    # Full article documents; COLLECTION holds the searchable chunks
+    ARTICLES_COLLECTION: str = "medium_articles"
+    # Chunks encoded and sent per insert_many call; one encoder batch, so most articles span several
+    # batches and each insert overlaps with encoding the next
+    INSERT_BATCH_SIZE: int = 32
+    # insert_many batches kept in flight at once
+    INSERT_CONCURRENCY: int = 4
+
+
+class FirecrawlConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    API_KEY: str = "API_KEY"
+
+
+class OpenAIConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    API_KEY: str = ""
+
+
+class LLMConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    MODEL_NAME: str = "llama3.2" #mistral,llama3.2
+    TOKEN_LIMIT: int = 125000
+    TEMPERATURE: float = 0.1
+    OPENAI_TIMEOUT: int = 20
+    # Upper bound on concurrent requests to the LLM backend
+    MAX_INFLIGHT: int = 8
+    # Below this top vectorSearchScore the LLM is skipped; 0.0 only skips when nothing was retrieved
+    MIN_SEARCH_SCORE: float = 0.0
+
+
+class CacheConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    SIMILARITY_THRESHOLD: float = 0.95
+    MAX_ENTRIES: int = 1000
+    TTL: int = 900
+
+
+class EmbeddingConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    # Concurrent query encodes are grouped into batches of up to this size
+    BATCH_SIZE: int = 32
+    # Seconds to wait for more queries before encoding a batch
+    BATCH_DELAY: float = 0.005
+    # Distinct query texts whose embeddings are kept in memory
+    CACHE_SIZE: int = 4096
+    # Run the encoder in FP16 on GPU / dynamic INT8 on CPU
+    QUANTIZE: bool = False
+    # "torch", "onnx" or "openvino"; the latter two need `pip install sentence-transformers[onnx]` / `[openvino]`
+    BACKEND: str = "torch"
+
+
+class ServerConfig(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    # Workers for blocking Mongo/embedding calls run via asyncio.to_thread
+    THREAD_POOL_SIZE: int = (os.cpu_count() or 1) * 5
+
+
+class Config(BaseSettings):
+    # Any field can be overridden from the environment or .env, e.g. MNEMOSYNE_LLM__MODEL_NAME=gpt-4o-mini.
+    # The prefix keeps generic variables such as SERVER or CACHE from being parsed as config sections.
+    # extra='ignore' lets .env also hold unrelated keys (e.g. OPENAI_API_KEY) for other tools
+    model_config = SettingsConfigDict(env_prefix='MNEMOSYNE_', env_file='.env', env_nested_delimiter='__',
+                                      extra='ignore', frozen=True)
+
+    MONGO: MongoConfig = MongoConfig()
+    FIRECRAWL: FirecrawlConfig = FirecrawlConfig()
+    OPENAI: OpenAIConfig = OpenAIConfig()
+    LLM: LLMConfig = LLMConfig()
+    CACHE: CacheConfig = CacheConfig()
+    EMBEDDING: EmbeddingConfig = EmbeddingConfig()
+    SERVER: ServerConfig = ServerConfig()
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Return the process-wide Config instance, reading the environment once."""
+    return Config()
@@ -1,7 +1,16 @@
+import asyncio
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+
 from sentence_transformers import SentenceTransformer
 import torch
 
-def instantiate_model():
+@lru_cache(maxsize=4)
+def instantiate_model(backend: str = "torch", quantize: bool = False):
+    # Loading the weights is expensive, so every caller with the same settings shares one encoder
     device = 'cuda' if torch.cuda.is_available() else 'cpu'
     # check device being run on
     if device != 'cuda':
@@ -13,6 +22,71 @@ def instantiate_model():
 
     dense_model = SentenceTransformer(
         'msmarco-bert-base-dot-v5',
-        device=device
+        device=device,
+        backend=backend
     )
-    return dense_model
\ No newline at end of file
+    # The torch quantization below only applies to the eager PyTorch backend
+    if quantize and backend == 'torch':
+        # Off by default: check retrieval quality against the stored FP32 chunk vectors before enabling
+        if device == 'cuda':
+            dense_model.half()
+        else:
+            torch.quantization.quantize_dynamic(dense_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return dense_model
+
+
+class EmbeddingBatcher:
+    """Collects concurrent encode requests and runs them through the model as one batch."""
+
+    def __init__(self, model: SentenceTransformer, max_batch: int = 32, max_delay: float = 0.005,
+                 cache_size: int = 4096) -> None:
+        self.model = model
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        # Exact-text LRU of finished embeddings, so repeated queries skip the model entirely
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Created on first use so they belong to the serving loop, not the thread that built us
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> np.ndarray:
+        embedding = self._cache.get(text)
+        if embedding is not None:
+            self._cache.move_to_end(text)
+            return embedding
+
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        embedding = await future
+
+        self._cache[text] = embedding
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return embedding
+
+    async def _run(self) -> None:
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = [await self._queue.get()]
+            # Give requests arriving right behind the first one a chance to share its forward pass
+            await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                embeddings = await asyncio.to_thread(
+                    self.model.encode, [text for text, _ in batch], batch_size=self.max_batch
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                # The caller may have gone away while the batch was encoding
+                if not future.done():
+                    future.set_result(embedding)
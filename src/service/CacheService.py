@@ -0,0 +1,53 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+
+
+class CacheService:
+    """In-process semantic cache of streamed answers, keyed by query embedding similarity."""
+
+    def __init__(self, config: Config) -> None:
+        self.similarity_threshold = config.CACHE.SIMILARITY_THRESHOLD
+        self.max_entries = config.CACHE.MAX_ENTRIES
+        self.ttl = config.CACHE.TTL
+        # scope -> (unit query vectors, expiry times, chunks) with matching row order
+        self._buckets: Dict[str, Tuple[np.ndarray, np.ndarray, List[List[Any]]]] = {}
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding, scope: str) -> Optional[List[Any]]:
+        """Return the cached chunks of the most similar earlier query, if it is close enough and fresh."""
+        bucket = self._buckets.get(scope)
+        if bucket is None:
+            return None
+        vectors, expires_at, entries = bucket
+        # float32 on both sides so the matmul goes straight to BLAS without upcasting a copy of the bucket
+        similarities = vectors @ self._normalize(embedding)
+        # Expired rows can't win, so a live match behind a stale closer one is still found
+        similarities[expires_at < time.monotonic()] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        return entries[best]
+
+    def store(self, embedding, scope: str, chunks: List[Any]) -> None:
+        now = time.monotonic()
+        vector = self._normalize(embedding)
+        vectors, expires_at, entries = self._buckets.get(
+            scope, (np.empty((0, vector.shape[0]), dtype=np.float32), np.empty(0), [])
+        )
+        # Drop expired entries, then the oldest ones until the new entry fits
+        live = np.flatnonzero(expires_at > now)
+        live = live[max(0, len(live) - self.max_entries + 1):]
+        self._buckets[scope] = (
+            np.vstack([vectors[live], vector]),
+            np.append(expires_at[live], now + self.ttl),
+            [entries[i] for i in live] + [chunks],
+        )
@@ -1,18 +1,16 @@
-import json
 import asyncio
-from datetime import datetime
 from enum import Enum
-from typing import List, Dict, AsyncGenerator, Generator, Any
-from langchain.callbacks import AsyncIteratorCallbackHandler
+from typing import List, Dict, AsyncGenerator, Generator, Tuple, Union
+import orjson
 from langchain.chains import ConversationChain
 from langchain.chains.llm import LLMChain
 from langchain.memory import ConversationBufferMemory
 from langchain.prompts import PromptTemplate
 from langchain_community.chat_models import ChatOllama, ChatOpenAI
-from langchain_core.callbacks import StreamingStdOutCallbackHandler, CallbackManager
-from langchain_core.outputs import LLMResult
+from langchain_core.callbacks import StreamingStdOutCallbackHandler
+from langchain_core.language_models import BaseChatModel
 
-from src.service.llm_utils import parse_llm_output, LLMOutput, get_prompt, get_answer_prompt_ollama, \
+from src.service.llm_utils import parse_llm_output, build_llm_output, get_prompt, get_answer_prompt_ollama, \
     process_buffer_line_by_line, get_answer_prompt_openai
 from src.config import Config
 import logging
@@ -21,61 +19,51 @@ logger = logging.getLogger(__name__)
 logging.basicConfig()
 logger.setLevel(logging.INFO)
 
+# Reason on the default response used when the LLM's JSON could not be parsed
+PARSE_FAILURE_REASON = "Failed to parse the response"
 
-class AsyncStreamingCallbackHandler(AsyncIteratorCallbackHandler):
-    content: str = ""
+# Parsed once; PromptTemplate construction scans the whole template for its input variables
+_OPENAI_ANSWER_PROMPT = PromptTemplate(template=get_answer_prompt_openai(), input_variables=["query", "context"])
+_OLLAMA_ANSWER_PROMPT = PromptTemplate(template=get_answer_prompt_ollama(), input_variables=["query", "context"])
 
-    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
-        self.content += token
-        await self.queue.put(token)
-
-    async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
-        await self.queue.put(None)
 
 class LLMStrategy:
+    # Label used in log messages
+    provider_name = "LLM"
+
     def __init__(self, config: Config):
         self.config = config
+        # (model_name, streaming) -> chat model, so requests reuse the client and its HTTP connection pool
+        self._models: Dict[Tuple[str, bool], BaseChatModel] = {}
 
-    async def stream_answer_async(self, query: str, context: str, model_name: str, prompt_template: PromptTemplate) -> \
-    AsyncGenerator[str, None]:
-        pass
-
-    async def _stream_answer_sync(self, query: str, context: str, model_name: str) -> Generator[str, None, None]:
-        pass
-
-    async def generate_json(self, query: str, model_name: str, prompt: str) -> dict:
+    def _create_model(self, model_name: str, streaming: bool) -> BaseChatModel:
         pass
 
+    def _get_model(self, model_name: str, streaming: bool) -> BaseChatModel:
+        key = (model_name, streaming)
+        model = self._models.get(key)
+        if model is None:
+            model = self._models[key] = self._create_model(model_name, streaming)
+        return model
 
-class OpenAIStrategy(LLMStrategy):
     async def stream_answer_async(self, query: str, context: str, model_name: str, prompt_template: PromptTemplate) -> \
     AsyncGenerator[str, None]:
-        callback = AsyncStreamingCallbackHandler()
-
-        gpt_model = ChatOpenAI(
-            model_name=model_name,
-            temperature=self.config.LLM.TEMPERATURE,
-            openai_api_key=self.config.OPENAI.API_KEY,
-            streaming=True,
-            request_timeout=self.config.LLM.OPENAI_TIMEOUT,
-            callbacks=[callback],
-        )
-
-        llm_chain = LLMChain(llm=gpt_model, prompt=prompt_template)
-
-        task = asyncio.create_task(llm_chain.arun({"query": query, "context": context}))
+        llm_chain = prompt_template | self._get_model(model_name, streaming=True)
 
         buffer = ""
         in_code_block = False
 
-        async for token in callback.aiter():
-            if token is None:
-                break
-
-            buffer += token
-            output, buffer, in_code_block = await process_buffer_line_by_line(buffer, in_code_block)
-            if output:
-                yield output
+        try:
+            async for message in llm_chain.astream({"query": query, "context": context}):
+                buffer += message.content
+                # The buffer only produces output once it holds a full line or a code fence
+                if "\n" in buffer or "```" in buffer:
+                    output, buffer, in_code_block = await process_buffer_line_by_line(buffer, in_code_block)
+                    if output:
+                        yield output
+        except Exception as e:
+            logger.error(f"Error during streaming: {str(e)}")
+            raise
 
         # Handle any remaining content in the buffer
         while buffer:
@@ -83,139 +71,81 @@ class OpenAIStrategy(LLMStrategy):
             if output:
                 yield output
 
-        try:
-            await task
-        except Exception as e:
-            logger.error(f"Error during streaming: {str(e)}")
-            raise
-
-    async def _stream_answer_sync(self, query: str, context: str, model_name: str, prompt_template: PromptTemplate) -> Generator[str, None, None]:
-        gpt_model = ChatOpenAI(
-            model_name=model_name,
-            temperature=self.config.LLM.TEMPERATURE,
-            openai_api_key=self.config.OPENAI.API_KEY,
-            streaming=True,
-            request_timeout=self.config.LLM.OPENAI_TIMEOUT,
-            callbacks=[StreamingStdOutCallbackHandler()],
-        )
-
-        llm_chain = LLMChain(llm=gpt_model, prompt=prompt_template)
-
-        async for chunk in llm_chain.astream({"query": query, "context": context}):
-            if chunk and "text" in chunk:
-                yield chunk["text"]
+    async def _stream_answer_sync(self, query: str, context: str, model_name: str) -> Generator[str, None, None]:
+        pass
 
     async def generate_json(self, query: str, model_name: str, prompt: str) -> dict:
-        gpt_model = ChatOpenAI(
-            model_name=model_name,
-            temperature=self.config.LLM.TEMPERATURE,
-            openai_api_key=self.config.OPENAI.API_KEY,
-            request_timeout=self.config.LLM.OPENAI_TIMEOUT,
-        )
-        conversation_buf = ConversationChain(llm=gpt_model, memory=ConversationBufferMemory())
+        conversation_buf = ConversationChain(llm=self._get_model(model_name, streaming=False),
+                                             memory=ConversationBufferMemory())
 
         output = await conversation_buf.arun(prompt)
 
+        # Only a malformed LLM answer falls back to the default; anything else is a real bug and propagates
         try:
-            llm_output = parse_llm_output(output)
-            structured_dict = llm_output.dict()
-            logger.info(f"OpenAI response for query {query}", extra={
-                "model_name": model_name,
-                "knowledge_obj": json.dumps(structured_dict)
-            })
-            return structured_dict
+            structured_dict = parse_llm_output(output)
         except ValueError as e:
             logger.error(f"Error processing LLM response: {str(e)}")
             return self.generate_default_response()
 
+        logger.info(f"{self.provider_name} response for query {query}", extra={
+            "model_name": model_name,
+            "knowledge_obj": orjson.dumps(structured_dict).decode()
+        })
+        return structured_dict
 
-class OllamaStrategy(LLMStrategy):
-    async def stream_answer_async(self, query: str, context: str, model_name: str, prompt_template: PromptTemplate) -> \
-            AsyncGenerator[str, None]:
-        callback_handler = AsyncIteratorCallbackHandler()
-
-        gpt_model = ChatOllama(
-            model=model_name,
-            temperature=self.config.LLM.TEMPERATURE,
-            streaming=True,
-            callbacks=[callback_handler],
-            verbose=True
-        )
+    @staticmethod
+    def generate_default_response(reason: str = PARSE_FAILURE_REASON) -> dict:
+        return build_llm_output(reason=reason)
 
-        llm_chain = LLMChain(llm=gpt_model, prompt=prompt_template)
 
-        task = asyncio.create_task(llm_chain.arun({"query": query, "context": context}))
+class OpenAIStrategy(LLMStrategy):
+    provider_name = "OpenAI"
 
-        buffer = ""
-        in_code_block = False
+    def _create_model(self, model_name: str, streaming: bool) -> BaseChatModel:
+        return ChatOpenAI(
+            model_name=model_name,
+            temperature=self.config.LLM.TEMPERATURE,
+            openai_api_key=self.config.OPENAI.API_KEY,
+            streaming=streaming,
+            request_timeout=self.config.LLM.OPENAI_TIMEOUT,
+        )
 
-        async for token in callback_handler.aiter():
-            if token is None:
-                break
+    async def _stream_answer_sync(self, query: str, context: str, model_name: str, prompt_template: PromptTemplate) -> Generator[str, None, None]:
+        llm_chain = LLMChain(llm=self._get_model(model_name, streaming=True), prompt=prompt_template)
 
-            buffer += token
-            output, buffer, in_code_block = await process_buffer_line_by_line(buffer, in_code_block)
-            if output:
-                yield output
+        # Callbacks go on the call, not the shared model, so they don't leak into other requests
+        async for chunk in llm_chain.astream({"query": query, "context": context},
+                                             config={"callbacks": [StreamingStdOutCallbackHandler()]}):
+            if chunk and "text" in chunk:
+                yield chunk["text"]
 
-        # Handle any remaining content in the buffer
-        while buffer:
-            output, buffer, in_code_block = await process_buffer_line_by_line(buffer, in_code_block, final=True)
-            if output:
-                yield output
 
-        try:
-            await task
-        except Exception as e:
-            logger.error(f"Error during streaming: {str(e)}")
-            raise
+class OllamaStrategy(LLMStrategy):
+    provider_name = "Ollama"
+
+    def _create_model(self, model_name: str, streaming: bool) -> BaseChatModel:
+        if streaming:
+            return ChatOllama(
+                model=model_name,
+                temperature=self.config.LLM.TEMPERATURE,
+                streaming=True,
+                verbose=True
+            )
+        return ChatOllama(
+            model=model_name,
+            temperature=self.config.LLM.TEMPERATURE,
+            request_timeout=self.config.LLM.OPENAI_TIMEOUT
+        )
 
     async def _stream_answer_sync(self, query: str, context: str, model_name: str, prompt_template: PromptTemplate) -> Generator[str, None, None]:
-        prompt_template = PromptTemplate(template=get_answer_prompt_ollama(), input_variables=["query", "context"])
-        callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
-        gpt_model = ChatOllama(model=model_name, temperature=self.config.LLM.TEMPERATURE, callbacks=callback_manager)
-        llm_chain = LLMChain(llm=gpt_model, prompt=prompt_template)
-        async for chunk in llm_chain.astream({"query": query, "context": context}):
+        llm_chain = LLMChain(llm=self._get_model(model_name, streaming=True), prompt=_OLLAMA_ANSWER_PROMPT)
+        async for chunk in llm_chain.astream({"query": query, "context": context},
+                                             config={"callbacks": [StreamingStdOutCallbackHandler()]}):
             if 'text' in chunk:
                 content = chunk['text']
                 if content:
                     yield content
 
-    async def generate_json(self, query: str, model_name: str, prompt: str) -> dict:
-        gpt_model = ChatOllama(
-            model=model_name,
-            temperature=self.config.LLM.TEMPERATURE,
-            request_timeout=self.config.LLM.OPENAI_TIMEOUT
-        )
-
-        conversation_buf = ConversationChain(llm=gpt_model, memory=ConversationBufferMemory())
-
-        output = await conversation_buf.arun(prompt)
-
-        try:
-            llm_output = parse_llm_output(output)
-            structured_dict = llm_output.dict()
-            logger.info(f"Ollama response for query {query}", extra={
-                "model_name": model_name,
-                "knowledge_obj": json.dumps(structured_dict)
-            })
-            return structured_dict
-        except ValueError as e:
-            logger.error(f"Error processing LLM response: {str(e)}")
-            return self.generate_default_response()
-
-    @staticmethod
-    def generate_default_response() -> dict:
-        default_response = LLMOutput(
-            reason="Failed to parse the response",
-            confidence_score=0.0,
-            sources=[],
-            follow_up=[],
-            images=[],
-            timestamp=str(datetime.utcnow())
-        )
-        return default_response.dict()
-
 
 class LLMStrategyFactory:
     @staticmethod
@@ -231,6 +161,30 @@ class LLMMode(Enum):
 class LLMService:
     def __init__(self, config: Config):
         self.config = config
+        # Shared by all requests so bursts queue here instead of piling onto the backend
+        self.llm_semaphore = asyncio.Semaphore(config.LLM.MAX_INFLIGHT)
+        # One strategy per model name, so the chat clients it caches outlive a single query
+        self.strategies: Dict[str, LLMStrategy] = {}
+
+    def _get_strategy(self, model_name: str) -> LLMStrategy:
+        strategy = self.strategies.get(model_name)
+        if strategy is None:
+            strategy = self.strategies[model_name] = LLMStrategyFactory.create_strategy(model_name, self.config)
+        return strategy
+
+    def has_relevant_context(self, retrieved_info: List[Dict]) -> bool:
+        """Whether retrieval found anything scored high enough to be worth an LLM call."""
+        top_score = max((doc.get('search_score', 0) for doc in retrieved_info), default=None)
+        return top_score is not None and top_score >= self.config.LLM.MIN_SEARCH_SCORE
+
+    @staticmethod
+    def is_parsed_answer(metadata: Union[str, Dict]) -> bool:
+        """Whether the final chunk of query_knowledge is metadata parsed from the LLM, not the parse fallback."""
+        return isinstance(metadata, dict) and metadata.get('reason') != PARSE_FAILURE_REASON
+
+    async def _generate_json(self, strategy: LLMStrategy, query: str, model_name: str, prompt: str) -> dict:
+        async with self.llm_semaphore:
+            return await strategy.generate_json(query, model_name, prompt)
 
     async def query_knowledge(
         self,
@@ -238,21 +192,37 @@ class LLMService:
         query: str,
         model_name: str,
         mode: LLMMode
-    ) -> AsyncGenerator[str, None]:
-        context = json.dumps(retrieved_info, indent=2)
-        strategy = LLMStrategyFactory.create_strategy(model_name, self.config)
+    ) -> AsyncGenerator[Union[str, Dict], None]:
+        if not self.has_relevant_context(retrieved_info):
+            # Nothing to ground an answer in, so don't pay for either LLM call
+            reason = "No relevant sources found for the query"
+            yield reason
+            yield LLMStrategy.generate_default_response(reason)
+            return
 
-        prompt_template = PromptTemplate(
-            template=get_answer_prompt_openai() if "gpt" in model_name else get_answer_prompt_ollama(),
-            input_variables=["query", "context"]
-        )
+        # Compact: indentation would only add prompt tokens
+        context = orjson.dumps(retrieved_info).decode()
+        strategy = self._get_strategy(model_name)
 
-        if mode == LLMMode.SYNC:
-            async for chunk in strategy._stream_answer_sync(query, context, model_name, prompt_template):
-                yield chunk
-        else:
-            async for chunk in strategy.stream_answer_async(query, context, model_name, prompt_template):
-                yield chunk
+        prompt_template = _OPENAI_ANSWER_PROMPT if "gpt" in model_name else _OLLAMA_ANSWER_PROMPT
+
+        # The metadata call only needs the retrieved context, so run it alongside the answer stream
+        json_task = asyncio.create_task(self._generate_json(strategy, query, model_name, get_prompt(context, query)))
 
-        full_json = await strategy.generate_json(query, model_name, get_prompt(context, query))
-        yield json.dumps(full_json)
\ No newline at end of file
+        try:
+            async with self.llm_semaphore:
+                if mode == LLMMode.SYNC:
+                    async for chunk in strategy._stream_answer_sync(query, context, model_name, prompt_template):
+                        yield chunk
+                else:
+                    async for chunk in strategy.stream_answer_async(query, context, model_name, prompt_template):
+                        yield chunk
+
+            full_json = await json_task
+        finally:
+            # Don't leave the metadata call running if the stream failed or the client went away
+            json_task.cancel()
+            if json_task.done() and not json_task.cancelled():
+                # Mark a failure as retrieved so asyncio doesn't log "Task exception was never retrieved"
+                json_task.exception()
+        yield full_json
\ No newline at end of file
@@ -1,20 +1,49 @@
+import asyncio
+
 from joblib import executor
 
 from src.service.LLMService import LLMService,LLMMode
 from src.service.MongoService import MongoService
+from src.service.CacheService import CacheService
+from src.model.model_utls import EmbeddingBatcher, instantiate_model
 from src.config import Config
 
 class MnemsoyneService:
     def __init__(self, config: Config) -> None:
+        self.config = config
         self.llm_service = LLMService(config)
         self.mongo_service = MongoService(config)
+        self.cache_service = CacheService(config)
+        dense_model = instantiate_model(config.EMBEDDING.BACKEND, config.EMBEDDING.QUANTIZE)
+        self.embedding_batcher = EmbeddingBatcher(dense_model, config.EMBEDDING.BATCH_SIZE,
+                                                  config.EMBEDDING.BATCH_DELAY, config.EMBEDDING.CACHE_SIZE)
 
     def insert_knowledge(self, url: str):
         self.mongo_service.insert_data(url)
         #TODO add more logic here
 
-    def retrieve_knowlede(self, query: str, llm_mode: LLMMode):
-        retrived_info = self.mongo_service.retrieve_data(query)
-        knowledge_obj = self.llm_service.query_knowledge(retrived_info, query, model_name=Config.LLM.MODEL_NAME,
+    async def retrieve_knowlede(self, query: str, llm_mode: LLMMode):
+        # Concurrent searches share one encoder pass; the pymongo search below is blocking, so it runs in a thread
+        query_embedding = await self.embedding_batcher.embed(query)
+
+        # Near-duplicate queries replay the earlier answer without touching Mongo or the LLM
+        cache_scope = f"{self.config.LLM.MODEL_NAME}:{llm_mode.value}"
+        cached_chunks = self.cache_service.lookup(query_embedding, cache_scope)
+        if cached_chunks is not None:
+            for chunk in cached_chunks:
+                yield chunk
+            return
+
+        retrived_info = await asyncio.to_thread(self.mongo_service.retrieve_data, query, query_embedding)
+        knowledge_obj = self.llm_service.query_knowledge(retrived_info, query, model_name=self.config.LLM.MODEL_NAME,
                                                          mode=llm_mode)
-        return knowledge_obj
\ No newline at end of file
+        chunks = []
+        async for chunk in knowledge_obj:
+            chunks.append(chunk)
+            yield chunk
+
+        # Only complete answers grounded in retrieved documents are worth replaying; a metadata parse
+        # failure is a transient LLM hiccup and must not be served to near-duplicate queries for the TTL
+        if (chunks and self.llm_service.has_relevant_context(retrived_info)
+                and self.llm_service.is_parsed_answer(chunks[-1])):
+            self.cache_service.store(query_embedding, cache_scope, chunks)
\ No newline at end of file
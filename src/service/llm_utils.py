@@ -1,34 +1,36 @@
-import json
+import time
 from typing import List, Optional, AsyncGenerator, Tuple
-from pydantic.v1 import BaseModel, Field, validator
+from pydantic import ConfigDict, Field, TypeAdapter, ValidationError
+from typing_extensions import Annotated, TypedDict
 from datetime import datetime
 
-class ImageInfo(BaseModel):
+# (millisecond, ISO string) of the last timestamp handed out; one tuple so threads never see a torn pair
+_last_timestamp = (0, "")
+
+def _now_iso() -> str:
+    """UTC ISO timestamp, formatted at most once per millisecond."""
+    global _last_timestamp
+    ms = time.time_ns() // 1_000_000
+    last_ms, last_iso = _last_timestamp
+    if ms != last_ms:
+        last_iso = datetime.utcfromtimestamp(ms / 1000).isoformat()
+        _last_timestamp = (ms, last_iso)
+    return last_iso
+
+# Nested shapes are TypedDicts so pydantic-core validates them in place without building model objects
+class ImageInfo(TypedDict):
     url: str
     description: str
 
-class ResultInfo(BaseModel):
+class ResultInfo(TypedDict):
     title: str
     url: str
     content: str
 
-class LLMOutput(BaseModel):
-    reason: str = Field(description="The reason for this answer")
-    confidence_score: float = Field(description="The confidence score of the answer")
-    sources: Optional[List[ResultInfo]] = Field(default=None, description="Sources referenced for the answer")
-    follow_up: List[str] = Field(default_factory=list, description="List of potential follow-up questions")
-    images: Optional[List[ImageInfo]] = Field(default=None, description="Images related to the answer")
-    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat(),
-                           description="Timestamp of when the response was generated")
-
-    @validator('confidence_score')
-    def confidence_score_validation(cls, field: float) -> float:
-        if not isinstance(field, float) or not 0 <= field <= 1:
-            raise ValueError("Confidence score should be a float between 0 and 1")
-        return round(field, 5)
-
-    class Config:
-        schema_extra = {
+# A plain dict end to end; LLM output is validated once at the boundary by _LLM_OUTPUT_ADAPTER
+class LLMOutput(TypedDict, total=False):
+    __pydantic_config__ = ConfigDict(
+        json_schema_extra={
             "examples": [
                 {
                     "reason": "Example reason",
@@ -41,38 +43,57 @@ class LLMOutput(BaseModel):
                 }
             ]
         }
-
-def get_prompt(context, query) -> str:
-    return f"""
+    )
+
+    reason: Annotated[str, Field(description="The reason for this answer")]
+    confidence_score: Annotated[float, Field(ge=0.0, le=1.0, description="The confidence score of the answer")]
+    sources: Annotated[Optional[List[ResultInfo]], Field(description="Sources referenced for the answer")]
+    follow_up: Annotated[List[str], Field(description="List of potential follow-up questions")]
+    images: Annotated[Optional[List[ImageInfo]], Field(description="Images related to the answer")]
+    timestamp: Annotated[str, Field(description="Timestamp of when the response was generated")]
+
+_LLM_OUTPUT_ADAPTER = TypeAdapter(LLMOutput)
+
+def build_llm_output(**fields) -> LLMOutput:
+    """Fill in defaults for any field not given and stamp the output with the current time."""
+    return {
+        "reason": "No reason provided",
+        "confidence_score": 0.0,
+        "sources": [],
+        "follow_up": [],
+        "images": [],
+        **fields,
+        "timestamp": _now_iso(),
+    }
+
+# Every prompt keeps its fixed instructions first and the per-request QUERY/CONTEXT last,
+# so the shared prefix is eligible for provider-side prompt caching. The JSON prompt is plain
+# constants joined around the query and context, so no format pass walks its escaped braces.
+_PROMPT_PREFIX = """
     # TASK
-    Based on the following QUERY and CONTEXT, generate a JSON object that summarizes key information and metadata. You MUST include sources and images if they are present in the CONTEXT.
-
+    Based on the QUERY and CONTEXT at the end of this prompt, generate a JSON object that summarizes key information and metadata. You MUST include sources and images if they are present in the CONTEXT.
 
-    QUERY: {query}
-
-    CONTEXT: {context}
-    
     # RESPONSE FORMAT
     Your response MUST be a valid JSON object with the following structure:
-    {{
+    {
         "reason": "Your reasoning behind this answer, based solely on the information in the CONTEXT",
         "confidence_score": 0.95,
         "sources": [
-            {{
+            {
                 "title": "Source Title from CONTEXT",
                 "url": "Source URL from CONTEXT",
                 "content": "Relevant content from the source in CONTEXT",
                 "score": 1.0
-            }}
+            }
         ],
         "follow_up": ["A potential follow-up question", "Another potential follow-up question"],
         "images": [
-            {{
+            {
                 "url": "Image URL from Images in CONTEXT",
                 "description": "Image description based on the CONTEXT"
-            }}
+            }
         ]
-    }}
+    }
 
     Guidelines:
     1. The confidence_score should be between 0.0 (not confident) and 1.0 (extremely confident).
@@ -82,8 +103,17 @@ def get_prompt(context, query) -> str:
     5. If you cannot find relevant information in the CONTEXT to answer the query, set the confidence_score to 0.0.
 
     Remember, your entire response must be a valid JSON object. Do not include any text outside of the JSON object.
+
+    QUERY: """
+_PROMPT_MID = """
+
+    CONTEXT: """
+_PROMPT_SUFFIX = """
     """
 
+def get_prompt(context, query) -> str:
+    return "".join((_PROMPT_PREFIX, query, _PROMPT_MID, context, _PROMPT_SUFFIX))
+
 def get_answer_prompt_ollama() -> str:
     return """
         # YOUR ROLE
@@ -92,12 +122,6 @@ def get_answer_prompt_ollama() -> str:
     # TASK
     Answer the provided QUERY using ONLY the information in the CONTEXT section below. Do not add any information, examples, or suggestions that are not explicitly stated in the CONTEXT.
 
-    # CONTEXT
-    {context}
-
-    # QUERY
-    {query}
-
     # RESPONSE GUIDELINES
     1. Context Adherence:
        - Use ONLY information explicitly stated in the CONTEXT.
@@ -142,6 +166,12 @@ def get_answer_prompt_ollama() -> str:
     If you cannot answer the QUERY based solely on the CONTEXT, your entire response should be:
     "I apologize, but the provided context does not contain sufficient information to answer this query accurately."
 
+    # CONTEXT
+    {context}
+
+    # QUERY
+    {query}
+
     Begin your response now:
     """
 
@@ -154,11 +184,6 @@ def get_answer_prompt_openai() -> str:
     Do not add any information that is not explicitly stated in the CONTEXT.
     Your answer should be informed by the provided context. Your answer must be precise, of high-quality, and written by an expert using an unbiased and journalistic tone.
 
-    INITIAL_QUERY: {query}
-
-    CONTEXT:
-    {context}
-
     # General Instructions
     You MUST ADHERE to the following formatting instructions:
     - Use markdown to format code blocks, paragraphs, lists, tables, and quotes whenever possible.
@@ -170,50 +195,29 @@ def get_answer_prompt_openai() -> str:
     - Format your response in Markdown. Split paragraphs with more than two sentences into multiple chunks separated by a newline, and use bullet points to improve clarity.
     - Include code blocks from the CONTEXT
     - Do not include links or image urls in the markdown.
+
+    INITIAL_QUERY: {query}
+
+    CONTEXT:
+    {context}
     """
-def extract_and_parse_json(json_string: str) -> dict:
+def _json_span(text: str) -> Optional[str]:
     # Find the first '{' and last '}' to extract valid JSON content
-    start_idx = json_string.find('{')
-    end_idx = json_string.rfind('}')
-    
+    start_idx = text.find('{')
+    end_idx = text.rfind('}')
     if start_idx == -1 or end_idx == -1:
-        print("Error: JSON format not found.")
-        return None
-    
-    # Extract the JSON part from the string
-    json_content = json_string[start_idx:end_idx+1]
-    
-    try:
-        # Parse the extracted JSON content
-        parsed_json = json.loads(json_content)
-        return parsed_json
-    except json.JSONDecodeError as e:
-        print(f"Error parsing JSON: {e}")
         return None
+    return text[start_idx:end_idx+1]
 
 def parse_llm_output(output: str) -> LLMOutput:
+    json_content = _json_span(output)
+    if json_content is None:
+        raise ValueError("Error processing LLM output: JSON format not found")
+
     try:
-        parsed_output = extract_and_parse_json(output)
-
-        # Process sources to ensure they have a score
-        processed_sources = []
-        for source in parsed_output.get('sources', []):
-            processed_sources.append(ResultInfo(**source))
-
-        llm_output = LLMOutput(
-            reason=parsed_output.get('reason', 'No reason provided'),
-            confidence_score=float(parsed_output.get('confidence_score', 0.0)),
-            sources=processed_sources,
-            follow_up=parsed_output.get('follow_up', []),
-            images=[ImageInfo(**image) for image in parsed_output.get('images', [])],
-            timestamp=datetime.utcnow().isoformat()
-        )
-
-        return llm_output
-
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON in LLM output: {e}")
-    except Exception as e:
+        # Parse and validate in one pass; fields the LLM left out fall back to the defaults
+        return build_llm_output(**_LLM_OUTPUT_ADAPTER.validate_json(json_content))
+    except ValidationError as e:
         raise ValueError(f"Error processing LLM output: {e}")
 
 
@@ -243,67 +247,6 @@ def is_complete_markdown_block(text: str) -> bool:
 
     return False
 
-async def process_buffer_word_by_word(buffer: str):
-    in_code_block = False
-    code_block_buffer = ""
-
-    while buffer:
-        # Handle code blocks first
-        if "```" in buffer and not in_code_block:
-            parts = buffer.split("```", 1)
-            if parts[0].strip():
-                yield parts[0]
-            in_code_block = True
-            code_lang = parts[1].strip() if len(parts) > 1 else ""
-            yield f"```{code_lang}\n"
-            buffer = parts[1].split('\n', 1)[1] if '\n' in parts[1] else ""
-            continue
-
-        elif "```" in buffer and in_code_block:
-            parts = buffer.split("```", 1)
-            yield parts[0] + "\n```\n"
-            buffer = parts[1] if len(parts) > 1 else ""
-            in_code_block = False
-            continue
-
-        elif in_code_block:
-            if "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                yield line + "\n"
-            else:
-                yield buffer
-                buffer = ""
-            continue
-
-        # Handle markdown blocks (headers and list items)
-        if is_header_start(buffer) or is_list_item_start(buffer):
-            if is_complete_markdown_block(buffer):
-                if '\n' in buffer:
-                    block, buffer = buffer.split('\n', 1)
-                    yield block.strip() + '\n'
-                else:
-                    yield buffer
-                    buffer = ""
-            continue
-
-        # Handle regular text with word boundaries
-        delimiters = {" ", "\n", ".", ",", "!", "?", ":", ";"}
-        delimiter_positions = [buffer.find(delim) for delim in delimiters if delim in buffer]
-        if delimiter_positions:
-            last_delim_pos = max(pos for pos in delimiter_positions if pos != -1)
-            if last_delim_pos >= 0:
-                complete_portion = buffer[:last_delim_pos + 1]
-                if complete_portion.strip():
-                    yield complete_portion
-                buffer = buffer[last_delim_pos + 1:]
-        else:
-            yield buffer
-            buffer = ""
-
-    # Yield any remaining content
-    if buffer.strip():
-        yield buffer
-
 async def process_buffer_line_by_line(buffer: str, in_code_block: bool, final: bool = False) -> Tuple[str, str, bool]:
     output = ""
 
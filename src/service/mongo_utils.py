@@ -1,57 +1,12 @@
 import re
 import requests
-from bs4 import BeautifulSoup
 from firecrawl import FirecrawlApp
-from src.config import Config
-import re
-
-firecrawl_app = FirecrawlApp(Config.FIRECRAWL.API_KEY)
-
-def extract_data_from_url(url: str):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-    }
-
-    response = requests.get(url, headers=headers)
-    soup = BeautifulSoup(response.text, 'html.parser')
-
-    # Extract the title of the page
-    title = soup.title.string if soup.title else "No title found"
-    title = re.sub(r'\s*-\s*Freedium$', '', title).strip()
-
-    # Initialize containers for content, images, and code blocks
-    article_content = ""
-    images = []
-    code_blocks = []
-
-    # Find content between the markers "< Go to the original" and "Reporting a Problem"
-    start_marker = "< Go to the original"
-    end_marker = "Reporting a Problem"
-
-    page_text = soup.get_text()
-    start_index = page_text.find(start_marker)
-    end_index = page_text.find(end_marker)
-
-    if start_index != -1 and end_index != -1:
-        article_content = page_text[start_index + len(start_marker):end_index].strip()
-
-    # Extract content, images, and code blocks using BeautifulSoup
-    for tag in soup.find_all(True):  # Find all tags
-        if tag.name == 'img':
-            src = tag.get('src')
-            if src and re.search(r'\.(jpeg|jpg|png|gif)$', src, re.IGNORECASE):
-                # Clean and construct URL if necessary
-                cleaned_url = re.sub(r'/resize:[^/]+/', '/', src)
-                images.append(cleaned_url)
-
-        elif tag.name == 'pre' or tag.name == 'code':
-            code_blocks.append(tag.get_text())
+from src.config import get_config
 
-    # Remove code blocks from article content
-    for code in code_blocks:
-        article_content = article_content.replace(code, "")
+firecrawl_app = FirecrawlApp(get_config().FIRECRAWL.API_KEY)
 
-    return title, article_content, images, code_blocks
+_IMG_RE = re.compile(r'\.(jpeg|jpg|png|gif)$', re.IGNORECASE)
+_RESIZE_RE = re.compile(r'/resize:[^/]+/')
 
 
 def extract_data_from_firecrawl(url: str):
@@ -82,13 +37,17 @@ def divide_text_into_chunks(text, limit=1000):
         chunks = []
         all_contexts = ' '.join(contexts).split('.')
         chunk = []
+        # Running len('.'.join(chunk)) minus the separators, so the limit check doesn't rebuild the string
+        chunk_len = 0
         for context in all_contexts:
             chunk.append(context)
-            if len(chunk) >= 3 and len('.'.join(chunk)) > limit:
+            chunk_len += len(context)
+            if len(chunk) >= 3 and chunk_len + len(chunk) - 1 > limit:
                 # surpassed limit so add to chunks and reset
                 chunks.append('.'.join(chunk).strip() + '.')
                 # add some overlap between passages
                 chunk = chunk[-2:]
+                chunk_len = len(chunk[0]) + len(chunk[1])
         # if we finish and still have a chunk, add it
         if chunk:
             chunks.append('.'.join(chunk).strip() + '.')
@@ -120,8 +79,8 @@ class MarkdownExtractor:
         images = re.findall(image_pattern, self.markdown_string)
         res = []
         for image in images:
-            if image and re.search(r'\.(jpeg|jpg|png|gif)$', image, re.IGNORECASE):
-                cleaned_url = re.sub(r'/resize:[^/]+/', '/', image)
+            if image and _IMG_RE.search(image):
+                cleaned_url = _RESIZE_RE.sub('/', image)
                 res.append(cleaned_url)
         return res
 